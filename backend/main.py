@@ -4,14 +4,17 @@ FastAPI server for shadow generation.
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 import numpy as np
+import asyncio
+import functools
 import io
 import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
-from services.subject_extractor import SubjectExtractor
-from services.shadow_generator import ShadowGenerator
+from services.registry import get_subject_extractor, get_shadow_generator
 
 app = FastAPI(title="Shadow Generator API")
 
@@ -23,12 +26,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-subject_extractor = SubjectExtractor()
-shadow_generator = ShadowGenerator()
+# PNG encoding releases the GIL, so output saves run in parallel off the event loop
+save_executor = ThreadPoolExecutor(max_workers=4)
+
+# Image formats accepted for uploads; the frontend allows any image/* file
+UPLOAD_FORMATS = ["JPEG", "PNG", "WEBP", "GIF", "BMP", "TIFF"]
+
+# zlib level for shadow_only/mask_debug PNGs (Pillow default is 6)
+DEBUG_PNG_COMPRESS_LEVEL = 1
 
 os.makedirs("outputs", exist_ok=True)
 
 
+@app.on_event("startup")
+async def load_services():
+    """Build services before accepting traffic so the first request isn't penalized."""
+    get_subject_extractor()
+    get_shadow_generator()
+
+
 @app.get("/")
 async def root():
     return {"message": "Shadow Generator API"}
@@ -62,16 +78,25 @@ async def process_images(
         foreground_bytes = await foreground.read()
         background_bytes = await background.read()
         
-        background_image = Image.open(io.BytesIO(background_bytes)).convert('RGB')
+        background_image = Image.open(io.BytesIO(background_bytes), formats=UPLOAD_FORMATS)
+        background_image = background_image.convert('RGB')
         bg_width, bg_height = background_image.size
         
-        subject_image, subject_mask = subject_extractor.extract_subject_from_bytes(foreground_bytes)
+        subject_extractor = get_subject_extractor()
+        shadow_generator = get_shadow_generator()
+        
+        subject_image, subject_mask = subject_extractor.extract_subject_from_bytes(
+            foreground_bytes, formats=UPLOAD_FORMATS
+        )
         
         # Process depth map if provided
         depth_map_array = None
         if depth_map:
             depth_map_bytes = await depth_map.read()
-            depth_image = Image.open(io.BytesIO(depth_map_bytes)).convert('L')
+            depth_image = Image.open(io.BytesIO(depth_map_bytes), formats=UPLOAD_FORMATS)
+            # Let JPEG decode straight to grayscale at (roughly) the target size
+            depth_image.draft('L', (bg_width, bg_height))
+            depth_image = depth_image.convert('L')
             # Resize depth map to match background
             depth_image = depth_image.resize((bg_width, bg_height), Image.LANCZOS)
             depth_map_array = np.array(depth_image)
@@ -107,9 +132,36 @@ async def process_images(
         shadow_path = "outputs/shadow_only.png"
         mask_path = "outputs/mask_debug.png"
         
-        composite.save(composite_path)
-        Image.fromarray(shadow, mode='L').save(shadow_path)
-        mask_debug.save(mask_path)
+        # Debug outputs favour encode speed over file size
+        debug_params = {"compress_level": DEBUG_PNG_COMPRESS_LEVEL}
+        outputs = [
+            (composite, composite_path, {}),
+            (Image.fromarray(shadow, mode='L'), shadow_path, debug_params),
+            (mask_debug, mask_path, debug_params),
+        ]
+        
+        # Encode to per-request temporary files, then move all three into place
+        # on the event loop, so overlapping requests never tear or mix outputs
+        token = uuid.uuid4().hex
+        tmp_paths = [f"{path}.{token}.tmp" for _, path, _ in outputs]
+        loop = asyncio.get_running_loop()
+        try:
+            # Let every encode finish before cleanup, even if one fails
+            results = await asyncio.gather(*(
+                loop.run_in_executor(
+                    save_executor, functools.partial(image.save, tmp_path, format="PNG", **params)
+                )
+                for (image, _, params), tmp_path in zip(outputs, tmp_paths)
+            ), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+            for (_, path, _), tmp_path in zip(outputs, tmp_paths):
+                os.replace(tmp_path, path)
+        finally:
+            for tmp_path in tmp_paths:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
         
         return JSONResponse({
             "composite": composite_path,
@@ -118,6 +170,11 @@ async def process_images(
             "message": "Processing complete"
         })
         
+    except UnidentifiedImageError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported image format; expected one of {', '.join(UPLOAD_FORMATS)}"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
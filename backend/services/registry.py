@@ -0,0 +1,19 @@
+"""
+Process-wide service instances, created lazily on first use.
+"""
+from functools import lru_cache
+
+from services.subject_extractor import SubjectExtractor
+from services.shadow_generator import ShadowGenerator
+
+
+@lru_cache(maxsize=1)
+def get_subject_extractor() -> SubjectExtractor:
+    """Return the shared SubjectExtractor, creating it on first use."""
+    return SubjectExtractor()
+
+
+@lru_cache(maxsize=1)
+def get_shadow_generator() -> ShadowGenerator:
+    """Return the shared ShadowGenerator, creating it on first use."""
+    return ShadowGenerator()
@@ -3,13 +3,70 @@ import numpy as np
 from PIL import Image
 import cv2
 from typing import Tuple, Optional
-from scipy.ndimage import distance_transform_edt
+from collections import OrderedDict
+import hashlib
 import math
+import threading
 
 
 class ShadowGenerator:
     """Generates realistic shadows with contact shadow and soft falloff."""
     
+    # Progressive blur radii (px), from sharp near contact to soft far away
+    BLUR_LEVELS = (0, 3, 6, 9, 12, 15)
+    # Number of pyrDown levels available to the progressive blur
+    PYRAMID_DEPTH = 2
+    # Default resolution the shadow is computed at, relative to the background.
+    # The shadow is low-frequency, so it is upsampled at the end.
+    WORK_SCALE = 0.5
+    # Memory budget for recent shadows kept for repeated renders of the same
+    # inputs; shadows are full-resolution uint8, ~7 MB each at 3000x2400
+    SHADOW_CACHE_BYTES = 64 * 1024 * 1024
+    
+    def __init__(self, work_scale: float = WORK_SCALE):
+        """
+        Initialize the shadow generator and precompute blur kernels.
+        
+        Args:
+            work_scale: Resolution of the shadow pipeline relative to the
+                background (1.0 = full resolution, 0.25 = quarter)
+        """
+        if not 0 < work_scale <= 1:
+            raise ValueError(f"work_scale must be in (0, 1], got {work_scale}")
+        self.work_scale = work_scale
+        
+        # Wide blurs run on downsampled pyramid levels, keeping the
+        # per-level kernel near 3px regardless of the requested radius
+        self._blur_kernels = {}
+        for b in self.BLUR_LEVELS[1:]:
+            radius = b * self.work_scale
+            level = max(0, min(int(math.log2(radius / 3)), self.PYRAMID_DEPTH))
+            sigma = radius / 2**level
+            k = int(round(sigma)) * 2 + 1
+            self._blur_kernels[b] = (level, cv2.getGaussianKernel(k, sigma, cv2.CV_32F))
+        
+        # Closing for gaps in the projected silhouette: two dilations by a
+        # square are one dilation by a square twice the radius
+        erode_size = 2 * round(2 * self.work_scale) + 1
+        dilate_size = 2 * max(1, round(4 * self.work_scale)) + 1
+        self._gap_erode_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (erode_size, erode_size))
+        self._gap_dilate_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (dilate_size, dilate_size))
+        
+        # Offload blurs and remaps to the GPU when OpenCV is built with CUDA
+        self._use_cuda = hasattr(cv2, 'cuda') and cv2.cuda.getCudaEnabledDeviceCount() > 0
+        if self._use_cuda:
+            self._cuda_blur_filters = {
+                b: (level, cv2.cuda.createSeparableLinearFilter(cv2.CV_32F, cv2.CV_32F, kernel, kernel))
+                for b, (level, kernel) in self._blur_kernels.items()
+            }
+        
+        # Fixed-point (x256) background multiplier per shadow value: 1 - 0.7 * s / 255
+        self._shadow_factor_lut = np.round((1 - np.arange(256) / 255.0 * 0.7) * 256).astype(np.uint16)
+        
+        self._shadow_cache = OrderedDict()
+        self._shadow_cache_bytes = 0
+        self._shadow_cache_lock = threading.Lock()
+    
     def generate_shadow(
         self,
         subject_mask: np.ndarray,
@@ -30,14 +87,74 @@ class ShadowGenerator:
         - 0° elevation = very long shadows (horizontal light)
         - 45° elevation = shadow length equals object height  
         - 90° elevation = no shadow (overhead light)
+        
+        Results are memoized per subject mask and parameters, so re-rendering
+        the same subject with previously used light settings is a lookup.
+        Calls with a depth map are not cached.
         """
-        bg_width, bg_height = background_size
-        mask_height, mask_width = subject_mask.shape
+        if depth_map is not None:
+            return self._render_shadow(
+                subject_mask, background_size, light_angle, light_elevation, depth_map,
+                subject_x, subject_y, max_shadow_distance, base_intensity, max_opacity
+            )
+        
+        key = (
+            hashlib.blake2b(np.ascontiguousarray(subject_mask).data, digest_size=16).digest(),
+            subject_mask.shape, tuple(background_size), light_angle, light_elevation,
+            subject_x, subject_y, max_shadow_distance, base_intensity, max_opacity
+        )
+        with self._shadow_cache_lock:
+            cached = self._shadow_cache.get(key)
+            if cached is not None:
+                self._shadow_cache.move_to_end(key)
+                return cached.copy()
+        
+        shadow = self._render_shadow(
+            subject_mask, background_size, light_angle, light_elevation, None,
+            subject_x, subject_y, max_shadow_distance, base_intensity, max_opacity
+        )
         
-        mask_binary = (subject_mask > 127).astype(np.uint8)
+        if shadow.nbytes > self.SHADOW_CACHE_BYTES:
+            return shadow
+        with self._shadow_cache_lock:
+            if key not in self._shadow_cache:
+                self._shadow_cache[key] = shadow.copy()
+                self._shadow_cache_bytes += shadow.nbytes
+            while self._shadow_cache_bytes > self.SHADOW_CACHE_BYTES:
+                _, evicted = self._shadow_cache.popitem(last=False)
+                self._shadow_cache_bytes -= evicted.nbytes
+        return shadow
+    
+    def _render_shadow(
+        self, subject_mask: np.ndarray, background_size: Tuple[int, int],
+        light_angle: float, light_elevation: float, depth_map: Optional[np.ndarray],
+        subject_x: int, subject_y: int, max_shadow_distance: float,
+        base_intensity: float, max_opacity: float
+    ) -> np.ndarray:
+        """Render the shadow for generate_shadow, without caching."""
+        out_width, out_height = background_size
+        full_mask_binary = (subject_mask > 127).astype(np.uint8)
+        
+        # Work on a reduced grid; pixel-sized parameters scale with it
+        scale = self.work_scale
+        bg_width = max(1, round(out_width * scale))
+        bg_height = max(1, round(out_height * scale))
+        if scale != 1.0:
+            work_mask = cv2.resize(
+                subject_mask,
+                (max(1, round(subject_mask.shape[1] * scale)), max(1, round(subject_mask.shape[0] * scale))),
+                interpolation=cv2.INTER_AREA
+            )
+        else:
+            work_mask = subject_mask
+        mask_binary = (work_mask > 127).astype(np.uint8)
+        mask_height, mask_width = mask_binary.shape
         
-        subject_x = max(0, min(subject_x, bg_width - mask_width))
-        subject_y = max(0, min(subject_y, bg_height - mask_height))
+        full_subject_x = max(0, min(subject_x, out_width - subject_mask.shape[1]))
+        full_subject_y = max(0, min(subject_y, out_height - subject_mask.shape[0]))
+        subject_x = max(0, min(round(subject_x * scale), bg_width - mask_width))
+        subject_y = max(0, min(round(subject_y * scale), bg_height - mask_height))
+        max_shadow_distance = max_shadow_distance * scale
         
         # Calculate light direction
         angle_rad = math.radians(light_angle)
@@ -67,245 +184,332 @@ class ShadowGenerator:
         shadow_silhouette = np.zeros((bg_height, bg_width), dtype=np.uint8)
         
         # Find ground level (bottom of mask)
-        bottom_y = mask_height - 1
-        for y in range(mask_height - 1, -1, -1):
-            if np.any(mask_binary[y, :] > 0):
-                bottom_y = y
-                break
+        mask_ys, mask_xs = np.nonzero(mask_binary)
+        bottom_y = int(mask_ys.max()) if len(mask_ys) else mask_height - 1
         
         ground_y_bg = subject_y + bottom_y
         
-        # Project each mask point - higher points cast shadows further
-        for y in range(mask_height):
-            for x in range(mask_width):
-                if mask_binary[y, x] > 0:
-                    height_from_ground = max(0, (bottom_y - y) / max(1, bottom_y))
-                    shadow_offset = height_from_ground * projection_scale * estimated_subject_height
-                    
-                    bg_x = x + subject_x
-                    proj_x = bg_x + shadow_dir_x * shadow_offset
-                    proj_y = ground_y_bg + shadow_dir_y * shadow_offset
-                    
-                    if 0 <= proj_x < bg_width and 0 <= proj_y < bg_height:
-                        shadow_silhouette[int(proj_y), int(proj_x)] = 255
+        # Project each mask point - higher points cast shadows further.
+        # The offset depends only on the row, so compute it once per row.
+        height_from_ground = np.maximum(0, (bottom_y - np.arange(mask_height)) / max(1, bottom_y))
+        shadow_offset = height_from_ground * projection_scale * estimated_subject_height
+        row_dx = shadow_dir_x * shadow_offset
+        row_proj_y = ground_y_bg + shadow_dir_y * shadow_offset
+        proj_x = mask_xs + subject_x + row_dx[mask_ys]
+        proj_y = row_proj_y[mask_ys]
+        in_bounds = (proj_x >= 0) & (proj_x < bg_width) & (proj_y >= 0) & (proj_y < bg_height)
+        shadow_silhouette[proj_y[in_bounds].astype(np.intp), proj_x[in_bounds].astype(np.intp)] = 255
         
         # Fill gaps in shadow silhouette
-        kernel = np.ones((5, 5), np.uint8)
-        shadow_silhouette = cv2.dilate(shadow_silhouette, kernel, iterations=2)
-        shadow_silhouette = cv2.erode(shadow_silhouette, kernel, iterations=1)
+        shadow_silhouette = cv2.dilate(shadow_silhouette, self._gap_dilate_kernel)
+        shadow_silhouette = cv2.erode(shadow_silhouette, self._gap_erode_kernel)
         
         # Find contact points (bottom edge of subject)
         contact_points = self._find_contact_points(mask_binary)
         
         # Create contact shadow (darkest near feet)
         contact_shadow = np.zeros((bg_height, bg_width), dtype=np.float32)
-        contact_radius = 25
-        
-        for y, x in contact_points:
-            bg_x = x + subject_x
-            bg_y = y + subject_y
+        contact_radius = max(1, round(25 * scale))
+        contact_shift = 5 * scale
+        
+        # Each contact point stamps a radial falloff, keeping the max where stamps
+        # overlap. The falloff only decreases with distance, so that max is the
+        # falloff of the distance to the nearest contact point: one EDT over the
+        # padded box around all contact points.
+        contact_ys, contact_xs = contact_points
+        if len(contact_xs):
+            center_y = np.floor(contact_ys + subject_y + shadow_dir_y * contact_shift).astype(np.intp)
+            center_x = np.floor(contact_xs + subject_x + shadow_dir_x * contact_shift).astype(np.intp)
+            box_y0 = center_y.min() - contact_radius
+            box_x0 = center_x.min() - contact_radius
+            impulses = np.ones(
+                (center_y.max() + contact_radius + 1 - box_y0, center_x.max() + contact_radius + 1 - box_x0),
+                dtype=np.uint8
+            )
+            impulses[center_y - box_y0, center_x - box_x0] = 0
+            dists = cv2.distanceTransform(impulses, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+            falloff = np.where(
+                dists < contact_radius, 0.98 * np.exp(-dists / (contact_radius * 0.4)) * 255, 0
+            )
             
-            for dy in range(-contact_radius, contact_radius + 5):
-                for dx in range(-contact_radius, contact_radius + 5):
-                    px = int(bg_x + dx + shadow_dir_x * 5)
-                    py = int(bg_y + dy + shadow_dir_y * 5)
-                    
-                    if 0 <= px < bg_width and 0 <= py < bg_height:
-                        dist = math.sqrt(dx*dx + dy*dy)
-                        if dist < contact_radius:
-                            intensity = 0.98 * math.exp(-dist / (contact_radius * 0.4))
-                            contact_shadow[py, px] = max(contact_shadow[py, px], intensity * 255)
+            # Paste the part of the box that lies inside the background
+            y0, x0 = max(0, box_y0), max(0, box_x0)
+            y1 = min(bg_height, box_y0 + impulses.shape[0])
+            x1 = min(bg_width, box_x0 + impulses.shape[1])
+            if y0 < y1 and x0 < x1:
+                contact_shadow[y0:y1, x0:x1] = falloff[y0 - box_y0:y1 - box_y0, x0 - box_x0:x1 - box_x0]
         
         if np.any(contact_shadow > 0):
-            contact_shadow = cv2.GaussianBlur(contact_shadow, (7, 7), 2)
+            contact_blur = 2 * round(3 * scale) + 1
+            contact_shadow = cv2.GaussianBlur(contact_shadow, (contact_blur, contact_blur), 2 * scale)
         
         shadow = np.maximum(shadow, contact_shadow)
         
         # Create distance map from contact line
         distance_map = self._create_distance_map(
-            mask_binary, shadow_silhouette, bg_width, bg_height,
-            subject_x, subject_y, contact_points
+            shadow_silhouette, bg_width, bg_height,
+            subject_x, subject_y, contact_points,
+            line_half_height=max(1, round(3 * scale))
         )
         
-        # Apply soft shadow falloff
-        soft_shadow = self._apply_soft_falloff(distance_map, max_shadow_distance, max_opacity)
+        # Both the falloff and the progressive blur work on distance / max distance
+        normalized_dist = distance_map * np.float32(1 / max_shadow_distance)
+        np.clip(normalized_dist, 0, 1, out=normalized_dist)
         
-        # Only apply soft shadow where shadow silhouette exists
-        shadow_mask = (shadow_silhouette > 0).astype(np.float32)
-        soft_shadow = soft_shadow * shadow_mask
+        # Apply soft shadow falloff, only where shadow silhouette exists
+        shadow_pixels = shadow_silhouette > 0
+        soft_shadow = np.zeros((bg_height, bg_width), dtype=np.float32)
+        soft_shadow[shadow_pixels] = self._apply_soft_falloff(normalized_dist[shadow_pixels], max_opacity)
         
         # Fallback if no shadow silhouette was created
-        if np.sum(shadow_silhouette > 0) == 0:
+        if not shadow_pixels.any():
             offset_x = int(shadow_dir_x * projection_scale * estimated_subject_height * 0.3)
             offset_y = int(shadow_dir_y * projection_scale * estimated_subject_height * 0.3)
-            for y in range(mask_height):
-                for x in range(mask_width):
-                    if mask_binary[y, x] > 0:
-                        proj_x = x + subject_x + offset_x
-                        proj_y = y + subject_y + offset_y
-                        if 0 <= proj_x < bg_width and 0 <= proj_y < bg_height:
-                            shadow_silhouette[int(proj_y), int(proj_x)] = 255
-                            soft_shadow[int(proj_y), int(proj_x)] = max_opacity * 200
+            proj = self._offset_mask_points(
+                mask_ys, mask_xs, subject_x + offset_x, subject_y + offset_y, bg_width, bg_height
+            )
+            shadow_silhouette[proj] = 255
+            soft_shadow[proj] = max_opacity * 200
         
         shadow = np.maximum(shadow, soft_shadow)
         
         # Fallback if shadow is still mostly empty
-        if np.sum(shadow > 10) < 100:
+        if np.sum(shadow > 10) < 100 * scale * scale:
             offset_x = int(shadow_dir_x * projection_scale * estimated_subject_height * 0.5)
             offset_y = int(shadow_dir_y * projection_scale * estimated_subject_height * 0.5)
-            for y in range(mask_height):
-                for x in range(mask_width):
-                    if mask_binary[y, x] > 0:
-                        proj_x = x + subject_x + offset_x
-                        proj_y = y + subject_y + offset_y
-                        if 0 <= proj_x < bg_width and 0 <= proj_y < bg_height:
-                            shadow[int(proj_y), int(proj_x)] = max(
-                                shadow[int(proj_y), int(proj_x)],
-                                max_opacity * 200
-                            )
+            proj = self._offset_mask_points(
+                mask_ys, mask_xs, subject_x + offset_x, subject_y + offset_y, bg_width, bg_height
+            )
+            shadow[proj] = np.maximum(shadow[proj], max_opacity * 200)
+        
+        # Only the region around the shadow needs warping and blurring
+        ys, xs = np.nonzero(shadow)
+        if len(xs) == 0:
+            return np.zeros((out_height, out_width), dtype=np.uint8)
+        max_offset = 10 * scale
+        pad = math.ceil(3 * self.BLUR_LEVELS[-1] * scale + max_offset) + 1
+        # Start on a multiple of the coarsest pyramid step so pyrDown samples
+        # the same grid as it would on the full frame
+        step = 2 ** self.PYRAMID_DEPTH
+        roi = (
+            slice(max(0, ys.min() - pad) // step * step, min(bg_height, ys.max() + 1 + pad)),
+            slice(max(0, xs.min() - pad) // step * step, min(bg_width, xs.max() + 1 + pad))
+        )
+        shadow_roi = shadow[roi]
         
         # Apply depth warping if depth map provided
         if depth_map is not None:
-            shadow = self._apply_depth_warping(shadow, depth_map, shadow_dx, shadow_dy)
+            if depth_map.shape != (bg_height, bg_width):
+                depth_map = cv2.resize(depth_map, (bg_width, bg_height), interpolation=cv2.INTER_LANCZOS4)
+            shadow_roi = self._apply_depth_warping(
+                shadow_roi, depth_map[roi], shadow_dx, shadow_dy, max_offset=max_offset
+            )
         
         # Apply progressive blur
-        shadow = self._apply_progressive_blur(shadow, distance_map, max_shadow_distance)
+        shadow = np.zeros((bg_height, bg_width), dtype=np.uint8)
+        shadow[roi] = self._apply_progressive_blur(shadow_roi, normalized_dist[roi])
+        
+        if scale != 1.0:
+            shadow = cv2.resize(shadow, (out_width, out_height), interpolation=cv2.INTER_LINEAR)
         
-        # Remove shadow where subject is
-        full_mask = np.zeros((bg_height, bg_width), dtype=np.uint8)
-        if subject_y + mask_height <= bg_height and subject_x + mask_width <= bg_width:
-            full_mask[subject_y:subject_y+mask_height, subject_x:subject_x+mask_width] = mask_binary
-        shadow[full_mask > 0] = 0
+        # Remove shadow where subject is, at full resolution
+        mask_height, mask_width = full_mask_binary.shape
+        if full_subject_y + mask_height <= out_height and full_subject_x + mask_width <= out_width:
+            subject_region = shadow[
+                full_subject_y:full_subject_y+mask_height, full_subject_x:full_subject_x+mask_width
+            ]
+            np.multiply(subject_region, 1 - full_mask_binary, out=subject_region)
         
-        return np.clip(shadow, 0, 255).astype(np.uint8)
+        return shadow
     
-    def _find_contact_points(self, mask: np.ndarray) -> list:
-        """Find bottom edge points of subject."""
-        contact_points = []
-        height, width = mask.shape
-        for x in range(width):
-            for y in range(height - 1, -1, -1):
-                if mask[y, x] > 0:
-                    contact_points.append((y, x))
-                    break
-        return contact_points
+    def _offset_mask_points(
+        self, ys: np.ndarray, xs: np.ndarray, offset_x: int, offset_y: int,
+        bg_width: int, bg_height: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Shift mask points by an integer offset, keeping those inside the background."""
+        proj_y = ys + offset_y
+        proj_x = xs + offset_x
+        in_bounds = (proj_x >= 0) & (proj_x < bg_width) & (proj_y >= 0) & (proj_y < bg_height)
+        return proj_y[in_bounds], proj_x[in_bounds]
+    
+    def _find_contact_points(self, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Find bottom edge points of subject as (ys, xs) arrays, one per non-empty column."""
+        flipped = mask[::-1] > 0
+        xs = np.nonzero(flipped.any(axis=0))[0]
+        ys = (mask.shape[0] - 1) - np.argmax(flipped, axis=0)
+        return ys[xs], xs
     
     def _create_distance_map(
-        self, mask: np.ndarray, shadow_silhouette: np.ndarray,
+        self, shadow_silhouette: np.ndarray,
         bg_width: int, bg_height: int, subject_x: int, subject_y: int,
-        contact_points: list
+        contact_points: Tuple[np.ndarray, np.ndarray], line_half_height: int = 3
     ) -> np.ndarray:
         """Create distance map from contact line for shadow gradient."""
-        mask_height, mask_width = mask.shape
-        distance_map = np.full((bg_height, bg_width), float('inf'), dtype=np.float32)
-        
-        # Create contact line mask
-        contact_mask = np.zeros((bg_height, bg_width), dtype=np.uint8)
-        if contact_points:
-            for y, x in contact_points:
-                bg_x = x + subject_x
-                bg_y = y + subject_y
-                if 0 <= bg_x < bg_width and 0 <= bg_y < bg_height:
-                    for dy in range(-3, 4):
-                        if 0 <= bg_y + dy < bg_height:
-                            contact_mask[bg_y + dy, bg_x] = 255
-        
-        dist_from_contact = distance_transform_edt(~contact_mask.astype(bool))
-        
-        shadow_pixels = shadow_silhouette > 0
-        if np.any(shadow_pixels):
-            distance_map[shadow_pixels] = dist_from_contact[shadow_pixels]
-        
-        # Fill infinite values
-        max_dist = 300.0
-        if np.any(shadow_pixels):
-            valid_dists = dist_from_contact[shadow_pixels]
-            if len(valid_dists) > 0:
-                max_dist = np.max(valid_dists)
-        distance_map[distance_map == float('inf')] = max_dist
-        
+        bg_ys = contact_points[0] + subject_y
+        bg_xs = contact_points[1] + subject_x
+        in_bounds = (bg_xs >= 0) & (bg_xs < bg_width) & (bg_ys >= 0) & (bg_ys < bg_height)
+        
+        # Stamp a short vertical line at each contact point
+        line_ys = bg_ys[in_bounds, np.newaxis] + np.arange(-line_half_height, line_half_height + 1)
+        line_xs = np.broadcast_to(bg_xs[in_bounds, np.newaxis], line_ys.shape)
+        valid = (line_ys >= 0) & (line_ys < bg_height)
+        line_ys, line_xs = line_ys[valid], line_xs[valid]
+        
+        shadow_ys, shadow_xs = np.nonzero(shadow_silhouette)
+        if len(shadow_ys) == 0:
+            return np.full((bg_height, bg_width), np.float32(300.0))
+        if len(line_ys) == 0:
+            return np.full((bg_height, bg_width), np.float32(np.inf))
+        
+        # Distances are only read on the silhouette, so the transform runs on
+        # the box covering it and the contact line; the chamfer distance
+        # between two points never needs to leave their bounding box
+        y0 = min(shadow_ys.min(), line_ys.min())
+        x0 = min(shadow_xs.min(), line_xs.min())
+        y1 = max(shadow_ys.max(), line_ys.max()) + 1
+        x1 = max(shadow_xs.max(), line_xs.max()) + 1
+        contact_mask = np.ones((y1 - y0, x1 - x0), dtype=np.uint8)
+        contact_mask[line_ys - y0, line_xs - x0] = 0
+        
+        # The map only drives a 256-step falloff table and six blur levels,
+        # so the 3x3 chamfer approximation is precise enough
+        dist_from_contact = cv2.distanceTransform(contact_mask, cv2.DIST_L2, cv2.DIST_MASK_3)
+        
+        # Outside the silhouette, use the farthest in-silhouette distance
+        shadow_pixels = shadow_silhouette[y0:y1, x0:x1] > 0
+        max_dist = np.float32(dist_from_contact[shadow_pixels].max())
+        
+        distance_map = np.full((bg_height, bg_width), max_dist)
+        distance_map[y0:y1, x0:x1] = np.where(shadow_pixels, dist_from_contact, max_dist)
         return distance_map
     
-    def _apply_soft_falloff(
-        self, distance_map: np.ndarray, max_distance: float, max_opacity: float
-    ) -> np.ndarray:
+    def _apply_soft_falloff(self, normalized_dist: np.ndarray, max_opacity: float) -> np.ndarray:
         """Apply opacity falloff - darkest at contact, lighter with distance."""
-        normalized_dist = np.clip(distance_map / max_distance, 0, 1)
-        
-        # Dark near contact, fading with distance
-        opacity = max_opacity * (1.0 - normalized_dist * 0.7)
-        contact_boost = np.exp(-normalized_dist * 3) * 0.3
-        opacity = np.clip(opacity + contact_boost, 0.1, 1.0)
-        
-        return (opacity * 255).astype(np.float32)
+        # Tabulate the falloff over 256 distance steps, then look each pixel up
+        steps = np.linspace(0, 1, 256, dtype=np.float32)
+        opacity = max_opacity * (1 - steps * 0.7) + np.exp(steps * -3) * 0.3
+        falloff_lut = np.clip(opacity, 0.1, 1.0) * 255
+        
+        index = normalized_dist * np.float32(255)
+        index += 0.5
+        return falloff_lut[index.astype(np.uint8)]
     
-    def _apply_progressive_blur(
-        self, shadow: np.ndarray, distance_map: np.ndarray, max_distance: float
-    ) -> np.ndarray:
-        """Apply increasing blur with distance from subject."""
-        normalized_dist = np.clip(distance_map / max_distance, 0, 1)
+    def _apply_progressive_blur(self, shadow: np.ndarray, normalized_dist: np.ndarray) -> np.ndarray:
+        """Apply increasing blur with normalized (0-1) distance from subject."""
         shadow_float = shadow.astype(np.float32)
         
-        blur_levels = [0, 3, 6, 9, 12, 15]
-        blurred = []
-        for b in blur_levels:
-            if b == 0:
-                blurred.append(shadow_float.copy())
-            else:
-                blurred.append(cv2.GaussianBlur(shadow_float, (b*2+1, b*2+1), b))
+        blur_levels = self.BLUR_LEVELS
+        if self._use_cuda:
+            blurred = self._blur_levels_cuda(shadow_float)
+        else:
+            blurred = self._blur_levels_cpu(shadow_float)
+        
+        # Blend the two blur levels bracketing each pixel's distance
+        stack = np.stack(blurred)
+        lod = np.minimum(normalized_dist * len(blur_levels), len(blur_levels) - 1)
+        lo = lod.astype(np.intp)
+        hi = np.minimum(lo + 1, len(blur_levels) - 1)
+        t = (lod - lo).astype(np.float32)
+        result = (
+            (1 - t) * np.take_along_axis(stack, lo[np.newaxis], axis=0)[0]
+            + t * np.take_along_axis(stack, hi[np.newaxis], axis=0)[0]
+        )
         
-        result = shadow_float.copy()
+        return cv2.convertScaleAbs(result)
+    
+    def _pyramid_upsample_matrix(self, level: int) -> np.ndarray:
+        """
+        Inverse affine map from full-resolution pixels to a pyrDown level.
         
-        for i in range(len(blur_levels)):
-            low = i / len(blur_levels)
-            high = (i + 1) / len(blur_levels)
-            mask = (normalized_dist >= low) & (normalized_dist < high)
-            
-            if np.any(mask):
-                if i < len(blur_levels) - 1:
-                    t = np.clip((normalized_dist[mask] - low) / (high - low), 0, 1)
-                    result[mask] = blurred[i][mask] * (1 - t) + blurred[min(i+1, len(blurred)-1)][mask] * t
-                else:
-                    result[mask] = blurred[i][mask]
-        
-        # Handle remaining pixels
-        remaining = normalized_dist >= 1.0
-        if np.any(remaining):
-            result[remaining] = blurred[-1][remaining]
-        
-        return np.clip(result, 0, 255).astype(np.uint8)
+        Level pixel i sits on full-resolution pixel i * 2**level, so sampling
+        at x / 2**level keeps upsampled levels aligned with the sharp ones
+        (a pixel-centre resize would shift them by up to 2**level - 0.5 px).
+        """
+        f = 2 ** level
+        return np.array([[1 / f, 0, 0], [0, 1 / f, 0]], dtype=np.float64)
+    
+    def _blur_levels_cpu(self, shadow_float: np.ndarray) -> list:
+        """Blur shadow at every BLUR_LEVELS radius, sharpest first."""
+        height, width = shadow_float.shape
+        
+        # Gaussian pyramid for the wide blurs (see __init__)
+        pyramid = [shadow_float]
+        for _ in range(self.PYRAMID_DEPTH):
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        
+        blurred = [shadow_float]
+        for b in self.BLUR_LEVELS[1:]:
+            level, kernel = self._blur_kernels[b]
+            level_blur = cv2.sepFilter2D(pyramid[level], -1, kernel, kernel)
+            if level > 0:
+                level_blur = cv2.warpAffine(
+                    level_blur, self._pyramid_upsample_matrix(level), (width, height),
+                    flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE
+                )
+            blurred.append(level_blur)
+        return blurred
+    
+    def _blur_levels_cuda(self, shadow_float: np.ndarray) -> list:
+        """GPU version of _blur_levels_cpu: one upload, one download per level."""
+        height, width = shadow_float.shape
+        
+        pyramid = [cv2.cuda_GpuMat(shadow_float)]
+        for _ in range(self.PYRAMID_DEPTH):
+            pyramid.append(cv2.cuda.pyrDown(pyramid[-1]))
+        
+        blurred = [shadow_float]
+        for b in self.BLUR_LEVELS[1:]:
+            level, blur_filter = self._cuda_blur_filters[b]
+            level_blur = blur_filter.apply(pyramid[level])
+            if level > 0:
+                level_blur = cv2.cuda.warpAffine(
+                    level_blur, self._pyramid_upsample_matrix(level), (width, height),
+                    flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE
+                )
+            blurred.append(level_blur.download())
+        return blurred
     
     def _apply_depth_warping(
         self, shadow: np.ndarray, depth_map: np.ndarray,
-        shadow_dx: float, shadow_dy: float
+        shadow_dx: float, shadow_dy: float, max_offset: float = 10.0
     ) -> np.ndarray:
-        """Warp shadow based on depth map - higher surfaces offset shadow more."""
+        """Warp shadow based on depth map (same shape) - higher surfaces offset shadow more."""
         height, width = shadow.shape
         
-        # Resize depth map if needed
-        if depth_map.shape != shadow.shape:
-            depth_img = Image.fromarray(depth_map, mode='L')
-            depth_img = depth_img.resize((width, height), Image.LANCZOS)
-            depth_map = np.array(depth_img)
-        
         # Invert: higher depth values = higher surfaces
         depth_norm = (255 - depth_map.astype(np.float32)) / 255.0
         
-        warped = np.zeros_like(shadow, dtype=np.float32)
-        
-        for y in range(height):
-            for x in range(width):
-                if shadow[y, x] > 0:
-                    offset = depth_norm[y, x] * 10
-                    new_x = int(x + shadow_dx * offset)
-                    new_y = int(y + shadow_dy * offset)
-                    
-                    if 0 <= new_x < width and 0 <= new_y < height:
-                        warped[new_y, new_x] = max(warped[new_y, new_x], shadow[y, x])
-                    else:
-                        warped[y, x] = max(warped[y, x], shadow[y, x])
-        
-        return np.clip(warped, 0, 255).astype(np.uint8)
+        offset = depth_norm * max_offset
+        shadow_float = shadow.astype(np.float32)
+        
+        # Gather each output pixel from where the shadow is displaced from
+        xs, ys = np.meshgrid(
+            np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32)
+        )
+        map_x = xs - shadow_dx * offset
+        map_y = ys - shadow_dy * offset
+        if self._use_cuda:
+            warped = cv2.cuda.remap(
+                cv2.cuda_GpuMat(shadow_float), cv2.cuda_GpuMat(map_x), cv2.cuda_GpuMat(map_y),
+                interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0
+            ).download()
+        else:
+            warped = cv2.remap(
+                shadow_float, map_x, map_y,
+                interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0
+            )
+        
+        # Shadow pixels displaced off-frame stay in place
+        src_y, src_x = np.nonzero(shadow)
+        target_x = src_x + shadow_dx * offset[src_y, src_x]
+        target_y = src_y + shadow_dy * offset[src_y, src_x]
+        out_of_bounds = (
+            (target_x <= -1) | (target_x >= width) | (target_y <= -1) | (target_y >= height)
+        )
+        keep = (src_y[out_of_bounds], src_x[out_of_bounds])
+        warped[keep] = np.maximum(warped[keep], shadow_float[keep])
+        
+        return cv2.convertScaleAbs(warped)
     
     def composite_images(
         self, foreground: Image.Image, background: Image.Image,
@@ -323,31 +527,36 @@ class ShadowGenerator:
         fg_width = min(fg_width, bg_width - subject_x)
         fg_height = min(fg_height, bg_height - subject_y)
         
-        composite = bg_array.copy().astype(np.float32)
-        
         # Ensure shadow has correct dimensions
         if len(shadow.shape) != 2:
             raise ValueError(f"Shadow must be 2D, got shape {shadow.shape}")
         
         if shadow.shape != (bg_height, bg_width):
-            shadow_img = Image.fromarray(shadow, mode='L')
-            shadow_img = shadow_img.resize((bg_width, bg_height), Image.LANCZOS)
-            shadow = np.array(shadow_img)
+            shadow = cv2.resize(shadow, (bg_width, bg_height), interpolation=cv2.INTER_LANCZOS4)
+        
+        composite = bg_array
         
-        # Apply shadow (darken background)
-        if np.any(shadow > 0):
-            shadow_intensity = shadow.astype(np.float32) / 255.0
-            shadow_factor = 1 - shadow_intensity[:, :, np.newaxis] * 0.7
-            composite = composite * shadow_factor
+        # Apply shadow (darken background) on its bounding box, in uint8 fixed point
+        shadow_rows = np.nonzero(shadow.any(axis=1))[0]
+        if len(shadow_rows):
+            shadow_cols = np.nonzero(shadow.any(axis=0))[0]
+            roi = (
+                slice(shadow_rows[0], shadow_rows[-1] + 1),
+                slice(shadow_cols[0], shadow_cols[-1] + 1)
+            )
+            shadow_factor = self._shadow_factor_lut[shadow[roi]][:, :, np.newaxis]
+            composite[roi] = (composite[roi] * shadow_factor + 128) >> 8
         
-        # Composite foreground
+        # Composite foreground on the subject region
         if subject_x >= 0 and subject_y >= 0 and fg_width > 0 and fg_height > 0:
             fg_region = fg_array[:fg_height, :fg_width]
-            alpha = fg_region[:, :, 3:4].astype(np.float32) / 255.0
+            alpha = fg_region[:, :, 3:4].astype(np.uint16)
             
-            bg_region = composite[subject_y:subject_y+fg_height, subject_x:subject_x+fg_width]
-            composite[subject_y:subject_y+fg_height, subject_x:subject_x+fg_width] = (
-                bg_region * (1 - alpha) + fg_region[:, :, :3] * alpha
-            )
-        
-        return Image.fromarray(np.clip(composite, 0, 255).astype(np.uint8))
+            # Integer alpha blend, rounding to nearest: (bg * (255 - a) + fg * a) / 255
+            region = (slice(subject_y, subject_y + fg_height), slice(subject_x, subject_x + fg_width))
+            blended = composite[region] * (255 - alpha)
+            blended += fg_region[:, :, :3] * alpha
+            blended += 127
+            composite[region] = blended // 255
+        
+        return Image.fromarray(composite)
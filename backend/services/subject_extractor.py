@@ -3,17 +3,23 @@ Subject extraction service using rembg for automatic background removal.
 """
 import numpy as np
 from PIL import Image
-from rembg import remove
-from typing import Tuple
+from rembg import new_session, remove
+from typing import List, Optional, Tuple
 import io
 
 
 class SubjectExtractor:
     """Extracts subject from background using rembg library."""
     
-    def __init__(self):
-        """Initialize the subject extractor."""
-        pass
+    def __init__(self, model_name: str = "u2net"):
+        """
+        Initialize the subject extractor.
+        
+        Args:
+            model_name: rembg model to use (e.g. "u2net", "u2netp", "isnet-general-use")
+        """
+        # Load the ONNX model once instead of on every remove() call
+        self.session = new_session(model_name)
     
     def extract_subject(self, image_path: str) -> Tuple[Image.Image, np.ndarray]:
         """
@@ -25,41 +31,36 @@ class SubjectExtractor:
         Returns:
             Tuple of (RGBA image with transparent background, binary mask as numpy array)
         """
-        # Read the image
-        with open(image_path, 'rb') as f:
-            input_data = f.read()
-        
-        # Remove background using rembg
-        output_data = remove(input_data)
-        
-        # Convert to PIL Image
-        subject_image = Image.open(io.BytesIO(output_data)).convert('RGBA')
+        # Remove background using rembg; PIL in, PIL out skips a PNG encode/decode
+        with Image.open(image_path) as input_image:
+            subject_image = remove(input_image, session=self.session).convert('RGBA')
         
         # Extract alpha channel as mask
-        mask = np.array(subject_image.split()[3])  # Alpha channel
-        mask = (mask > 0).astype(np.uint8) * 255  # Binary mask
+        alpha = np.asarray(subject_image)[:, :, 3]  # Alpha channel, no per-band split
+        mask = (alpha > 0).view(np.uint8) * 255  # Binary mask
         
         return subject_image, mask
     
-    def extract_subject_from_bytes(self, image_bytes: bytes) -> Tuple[Image.Image, np.ndarray]:
+    def extract_subject_from_bytes(
+        self, image_bytes: bytes, formats: Optional[List[str]] = None
+    ) -> Tuple[Image.Image, np.ndarray]:
         """
         Extract subject from image bytes and return RGBA image and mask.
         
         Args:
             image_bytes: Image data as bytes
+            formats: Pillow formats to try when decoding (None = all registered)
             
         Returns:
             Tuple of (RGBA image with transparent background, binary mask as numpy array)
         """
-        # Remove background using rembg
-        output_data = remove(image_bytes)
-        
-        # Convert to PIL Image
-        subject_image = Image.open(io.BytesIO(output_data)).convert('RGBA')
+        # Remove background using rembg; PIL in, PIL out skips a PNG encode/decode
+        input_image = Image.open(io.BytesIO(image_bytes), formats=formats)
+        subject_image = remove(input_image, session=self.session).convert('RGBA')
         
         # Extract alpha channel as mask
-        mask = np.array(subject_image.split()[3])  # Alpha channel
-        mask = (mask > 0).astype(np.uint8) * 255  # Binary mask
+        alpha = np.asarray(subject_image)[:, :, 3]  # Alpha channel, no per-band split
+        mask = (alpha > 0).view(np.uint8) * 255  # Binary mask
         
         return subject_image, mask
     